@@ -9,21 +9,37 @@ Author: Sepehr Moghiseh
 Telegram: @musifyyyybot
 GitHub: https://github.com/sepehrmoghiseh/musifyyy
 """
+import asyncio
 import logging
+import re
 from telegram.ext import (
+    AIORateLimiter,
     ApplicationBuilder,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     InlineQueryHandler,
     ChosenInlineResultHandler,
+    ContextTypes,
     filters
 )
+from telegram import Update
+from telegram.request import HTTPXRequest
 
-from config.settings import BOT_TOKEN, WEBHOOK_BASE_URL, PORT, validate_config
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from config.settings import (
+    BOT_TOKEN, WEBHOOK_BASE_URL, PORT, TELEGRAM_POOL_SIZE, TELEGRAM_POOL_TIMEOUT,
+    TELEGRAM_MEDIA_WRITE_TIMEOUT, TELEGRAM_MAX_RATE, TELEGRAM_MAX_RETRIES,
+    POLLING_TIMEOUT, validate_config
+)
 from handlers.commands import start, stats, search, broadcast, users
 from handlers.inline import inline_query, chosen_inline_result
 from handlers.callbacks import button_callback, error_handler
+from utils.database import user_db, search_db, open_databases, close_databases
 
 # Configure logging
 logging.basicConfig(
@@ -32,6 +48,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Text worth searching for: at least two word characters, not just
+# punctuation/noise. Rejected messages never reach the search handler.
+SEARCH_FILTER = (
+    filters.TEXT
+    & ~filters.COMMAND
+    & filters.Regex(re.compile(r"\w\W*\w"))
+)
+
+# Update types the handlers below consume; Telegram doesn't send the rest
+ALLOWED_UPDATES = [
+    Update.MESSAGE,
+    Update.CALLBACK_QUERY,
+    Update.INLINE_QUERY,
+    Update.CHOSEN_INLINE_RESULT,
+]
+
+# Inline queries are only searched from 3 characters on
+INLINE_QUERY_PATTERN = re.compile(r".{3}", re.DOTALL)
+
+
+class OrjsonRequest(HTTPXRequest):
+    """HTTPXRequest that parses Bot API responses with orjson when installed."""
+    
+    @staticmethod
+    def parse_json_payload(payload: bytes):
+        if orjson is not None:
+            try:
+                return orjson.loads(payload)
+            except orjson.JSONDecodeError:
+                # Let the stdlib parser handle (and report) malformed payloads
+                pass
+        return HTTPXRequest.parse_json_payload(payload)
+
+
+async def maintain_databases(context: ContextTypes.DEFAULT_TYPE):
+    """Write batched user activity and purge expired result lists."""
+    await user_db.flush()
+    await search_db.purge_expired()
+
+
+async def post_init(app):
+    """Open the cache database once the application is built."""
+    await open_databases()
+
+
+async def post_shutdown(app):
+    """Write what's left of the batched user activity and close the cache database."""
+    await close_databases()
+
 
 def build_application():
     """
@@ -43,8 +108,29 @@ def build_application():
     # Validate configuration
     validate_config()
     
-    # Build application
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    # Shared HTTP/2 connection pool for all Bot API calls. Concurrent uploads
+    # queue for a connection instead of failing after PTB's 1s default.
+    request = OrjsonRequest(
+        connection_pool_size=TELEGRAM_POOL_SIZE,
+        pool_timeout=TELEGRAM_POOL_TIMEOUT,
+        media_write_timeout=TELEGRAM_MEDIA_WRITE_TIMEOUT,
+        http_version="2"
+    )
+    
+    # Build application (updates from different chats are handled concurrently)
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .request(request)
+        .rate_limiter(AIORateLimiter(
+            overall_max_rate=TELEGRAM_MAX_RATE,
+            max_retries=TELEGRAM_MAX_RETRIES
+        ))
+        .concurrent_updates(True)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Add command handlers
     app.add_handler(CommandHandler("start", start))
@@ -53,27 +139,52 @@ def build_application():
     app.add_handler(CommandHandler("users", users))
     
     # Add inline mode handlers
-    app.add_handler(InlineQueryHandler(inline_query))
+    app.add_handler(InlineQueryHandler(inline_query, pattern=INLINE_QUERY_PATTERN))
     app.add_handler(ChosenInlineResultHandler(chosen_inline_result))
     
     # Add callback query handler for button clicks
     app.add_handler(CallbackQueryHandler(button_callback))
     
     # Add message handler for search queries
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, search))
+    app.add_handler(MessageHandler(SEARCH_FILTER, search))
     
     # Add error handler
     app.add_error_handler(error_handler)
     
+    # Periodic database upkeep; the job queue is awaited when the application stops
+    if app.job_queue is not None:
+        app.job_queue.run_repeating(
+            maintain_databases, interval=user_db.flush_interval, name="database_upkeep"
+        )
+    else:
+        logger.warning(
+            "Job queue unavailable (python-telegram-bot[job-queue] not installed), "
+            "user activity is only written in full batches and on shutdown"
+        )
+    
     logger.info("✅ Application built successfully")
     return app
 
 
+def install_event_loop():
+    """Use uvloop's faster event loop when it is available."""
+    try:
+        import uvloop
+    except ImportError:
+        logger.info("uvloop not installed, using the default asyncio event loop")
+        return
+    
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("✅ Using uvloop event loop")
+
+
 def main():
     """Main entry point for the bot."""
     logger.info("🎵 Starting Musifyyy Bot...")
     logger.info("=" * 50)
     
+    install_event_loop()
+    
     # Build the application
     app = build_application()
     
@@ -84,8 +195,8 @@ def main():
         webhook_url = f"{base_url}/webhook"
         
         logger.info("🚀 WEBHOOK MODE")
-        logger.info(f"   URL: {webhook_url}")
-        logger.info(f"   Port: {PORT}")
+        logger.info("   URL: %s", webhook_url)
+        logger.info("   Port: %s", PORT)
         logger.info("=" * 50)
         
         app.run_webhook(
@@ -93,13 +204,22 @@ def main():
             port=PORT,
             url_path="webhook",
             webhook_url=webhook_url,
+            allowed_updates=ALLOWED_UPDATES,
             drop_pending_updates=True
         )
     else:
         # Polling mode (for local development)
         logger.info("⚙️ POLLING MODE (Local Development)")
         logger.info("=" * 50)
-        app.run_polling(drop_pending_updates=True)
+        # Long polling: one getUpdates call waits up to POLLING_TIMEOUT seconds
+        # and the next one is sent as soon as it returns
+        app.run_polling(
+            timeout=POLLING_TIMEOUT,
+            poll_interval=0.0,
+            bootstrap_retries=-1,
+            allowed_updates=ALLOWED_UPDATES,
+            drop_pending_updates=True
+        )
 
 
 if __name__ == "__main__":
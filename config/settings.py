@@ -3,7 +3,9 @@ Configuration settings for the Musifyyy Bot.
 Manages environment variables and bot configuration.
 """
 import os
+import shutil
 import logging
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +14,13 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
 WEBHOOK_BASE_URL = os.environ.get("WEBHOOK_BASE_URL", "")
 PORT = int(os.environ.get("PORT", "8080"))
+TELEGRAM_POOL_SIZE = 64  # Concurrent connections kept open to the Bot API
+TELEGRAM_POOL_TIMEOUT = 10  # Seconds a request may wait for a free pooled connection
+TELEGRAM_MEDIA_WRITE_TIMEOUT = 60  # Seconds allowed for uploading an audio file
+TELEGRAM_MAX_RATE = 30  # Outgoing Bot API requests per second (Telegram's global limit)
+TELEGRAM_MAX_RETRIES = 2  # Times a request is retried after a 429 RetryAfter
+POLLING_TIMEOUT = 30  # Seconds each long-poll getUpdates call waits for new updates
+BROADCAST_CONCURRENCY = 25  # Broadcast messages in flight at once (pacing is left to the rate limiter)
 
 # Admin user ID(s) - Add your Telegram user ID here
 # To get your ID, message @userinfobot on Telegram
@@ -23,42 +32,88 @@ ADMIN_USER_IDS = [
 # ========== SEARCH CONFIGURATION ==========
 SEARCH_RESULTS_TOTAL = 30  # Total number of search results to fetch
 RESULTS_PER_PAGE = 5  # Number of results to show per page
+QUERY_CACHE_SIZE = 1024  # Max distinct queries kept in the search result cache
+QUERY_CACHE_TTL = 300  # Seconds a cached search result stays fresh
+QUERY_CACHE_EMPTY_TTL = 30  # Seconds an empty search result is cached (typos, no matches)
+SEARCH_CACHE_SIZE = 10000  # Max result lists kept for buttons
+SEARCH_CACHE_TTL = 600  # Seconds before a search's result buttons expire
+SEARCH_ID_BYTES = 6  # Random bytes in a search id (hex-encoded into callback_data)
+INLINE_RESULT_ID_BYTES = 8  # Random bytes in an inline result id (hex-encoded, echoed back by Telegram)
+INLINE_RESULT_CACHE_SIZE = 50000  # Max inline results remembered for chosen_inline_result
+INLINE_RESULT_CACHE_TTL = 600  # Seconds an inline result can still be picked and downloaded
+INLINE_CACHE_TIME = 300  # Seconds Telegram may reuse an inline answer for any user (keep <= INLINE_RESULT_CACHE_TTL)
+SEARCH_SOCKET_TIMEOUT = 5  # Seconds before a stalled search request is abandoned
+INLINE_DEBOUNCE_SECONDS = 0.4  # Quiet time after a keystroke before an inline search starts
 
 # ========== DOWNLOAD CONFIGURATION ==========
 AUDIO_QUALITY = "192"  # MP3 quality in kbps
 AUDIO_FORMAT = "mp3"
+MAX_SOURCE_SIZE = "49M"  # Largest source stream picked, in yt-dlp filesize syntax (Bot API uploads cap at 50 MB)
+MAX_TRACK_DURATION = 3600  # Longest track (seconds) downloaded at all; longer ones can't fit in an upload
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # Bot API limit for files sent by upload
+FILE_ID_CACHE_SIZE = 5000  # Max tracks remembered by their Telegram file_id
+FILE_ID_CACHE_TTL = 7 * 24 * 3600  # Seconds a cached file_id is reused before re-uploading
+FILE_ID_MISS_TTL = 300  # Seconds a URL known not to be uploaded skips the database lookup
+# SQLite file that keeps users, file_ids and result lists across restarts
+# (absolute, so it doesn't depend on the working directory)
+CACHE_DB_PATH = os.path.abspath(os.environ.get(
+    "CACHE_DB_PATH", os.path.join(os.path.dirname(__file__), "..", "musifyyy_cache.db")
+))
+USER_FLUSH_INTERVAL = 30  # Seconds users' activity updates are batched before being written
+USER_FLUSH_BATCH_SIZE = 256  # Changed users written at once, even before USER_FLUSH_INTERVAL
+ARIA2C_PATH = shutil.which("aria2c")  # Multi-connection HTTP downloader, used when installed
+ARIA2C_CONNECTIONS = 16  # Parallel connections/segments per file with aria2c
+# RAM-backed tmpfs for download/transcode scratch files when available (None = system temp dir)
+DOWNLOAD_TMP_ROOT = "/dev/shm" if os.access("/dev/shm", os.W_OK | os.X_OK) else None
+
+# ========== ANALYTICS CONFIGURATION ==========
+ANALYTICS_MAX_QUERIES = 10000  # Distinct queries counted before the least recent are dropped
+
+# ========== CONCURRENCY CONFIGURATION ==========
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "8"))  # Threads for blocking yt-dlp work
 
 # ========== YT-DLP CONFIGURATION ==========
+# Only these extractors are loaded (regexes on extractor names); the bot
+# never handles other sites, so the rest don't need to be imported or matched
+YTDLP_EXTRACTORS = ["soundcloud.*", "youtube.*"]
+
+# Render mounts secret files read-only; cookies are copied to a writable path
+_SECRET_COOKIE_PATH = "/etc/secrets/cookies.txt"
+_WRITABLE_COOKIE_PATH = "/tmp/cookies.txt"
+
+# Other common locations, probed in order
+_COOKIE_PATHS = (
+    "cookies.txt",
+    os.path.join(os.path.dirname(__file__), "..", "cookies.txt"),
+    "/app/cookies.txt",
+    os.path.join(os.getcwd(), "cookies.txt"),
+)
+
+
+@lru_cache(maxsize=None)
 def get_cookies_file():
     """
     Find and return the path to cookies.txt file.
-    Checks multiple possible locations.
+    Checks multiple possible locations once; later calls reuse the result.
     """
-    secret_cookie_path = "/etc/secrets/cookies.txt"
-    
     # Try secret path first (for Render)
-    if os.path.exists(secret_cookie_path):
-        try:
-            import shutil
-            writable_cookie_path = "/tmp/cookies.txt"
-            shutil.copy(secret_cookie_path, writable_cookie_path)
-            logger.info(f"✅ Copied cookies from {secret_cookie_path} to {writable_cookie_path}")
-            return writable_cookie_path
-        except Exception as e:
-            logger.error(f"Failed to copy cookies: {e}")
+    try:
+        shutil.copy(_SECRET_COOKIE_PATH, _WRITABLE_COOKIE_PATH)
+        logger.info("✅ Copied cookies from %s to %s", _SECRET_COOKIE_PATH, _WRITABLE_COOKIE_PATH)
+        return _WRITABLE_COOKIE_PATH
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error("Failed to copy cookies: %s", e)
     
-    # Try other common locations
-    possible_paths = [
-        "cookies.txt",
-        os.path.join(os.path.dirname(__file__), "..", "cookies.txt"),
-        "/app/cookies.txt",
-        os.path.join(os.getcwd(), "cookies.txt"),
-    ]
-    
-    for path in possible_paths:
-        if os.path.exists(path):
-            logger.info(f"✅ Found cookies.txt at: {path}")
-            return path
+    # Try other common locations (one stat per path)
+    for path in _COOKIE_PATHS:
+        try:
+            os.stat(path)
+        except OSError:
+            continue
+        logger.info("✅ Found cookies.txt at: %s", path)
+        return path
     
     logger.warning("⚠️ cookies.txt not found. YouTube downloads may be limited.")
     return None
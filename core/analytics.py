@@ -2,9 +2,32 @@
 Analytics tracking module for the Musifyyy Bot.
 Tracks searches, downloads, and platform usage statistics.
 """
-from collections import defaultdict
+import heapq
+from collections import defaultdict, OrderedDict
+from operator import itemgetter
 from typing import Dict, List, Tuple
 
+from config.settings import ANALYTICS_MAX_QUERIES
+
+
+class LRUCounter:
+    """Counter that forgets its least recently incremented keys beyond max_size."""
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+    
+    def increment(self, key: str, amount: int = 1):
+        """Add amount to a key's count, evicting the least recent key if full."""
+        self._counts[key] = self._counts.get(key, 0) + amount
+        self._counts.move_to_end(key)
+        if len(self._counts) > self.max_size:
+            self._counts.popitem(last=False)
+    
+    def items(self):
+        """Return (key, count) pairs."""
+        return self._counts.items()
+
 
 class Analytics:
     """Manages bot usage analytics and statistics."""
@@ -12,14 +35,15 @@ class Analytics:
     def __init__(self):
         self.total_searches = 0
         self.total_downloads = 0
-        self.popular_queries = defaultdict(int)
+        # Free-text keys are bounded; platforms are a small fixed set
+        self.popular_queries = LRUCounter(ANALYTICS_MAX_QUERIES)
         self.platform_usage = defaultdict(int)
-        self.inline_selections = defaultdict(int)
+        self.inline_selections = LRUCounter(ANALYTICS_MAX_QUERIES)
     
     def track_search(self, query: str):
         """Track a search query."""
         self.total_searches += 1
-        self.popular_queries[query.lower()] += 1
+        self.popular_queries.increment(query.lower())
     
     def track_download(self, platform: str):
         """Track a download from a specific platform."""
@@ -28,23 +52,15 @@ class Analytics:
     
     def track_inline_selection(self, query: str):
         """Track an inline mode selection."""
-        self.inline_selections[query.lower()] += 1
+        self.inline_selections.increment(query.lower())
     
     def get_top_queries(self, limit: int = 5) -> List[Tuple[str, int]]:
         """Get top search queries."""
-        return sorted(
-            self.popular_queries.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )[:limit]
+        return heapq.nlargest(limit, self.popular_queries.items(), key=itemgetter(1))
     
     def get_top_inline_selections(self, limit: int = 5) -> List[Tuple[str, int]]:
         """Get top inline selections."""
-        return sorted(
-            self.inline_selections.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )[:limit]
+        return heapq.nlargest(limit, self.inline_selections.items(), key=itemgetter(1))
     
     def get_platform_stats(self) -> Dict[str, int]:
         """Get platform usage statistics."""
@@ -54,37 +70,29 @@ class Analytics:
         """Generate a formatted statistics summary."""
         top_queries = self.get_top_queries()
         top_inline = self.get_top_inline_selections()
+        no_data = ["_No data yet_\n"]
         
-        stats_text = (
-            "📊 *Bot Statistics*\n\n"
-            f"🔍 Total Searches: {self.total_searches}\n"
-            f"⬇️ Total Downloads: {self.total_downloads}\n\n"
-            "*Top Search Queries:*\n"
-        )
-        
-        if top_queries:
-            for i, (query, count) in enumerate(top_queries, 1):
-                stats_text += f"{i}. {query} ({count}x)\n"
-        else:
-            stats_text += "_No data yet_\n"
-        
-        stats_text += "\n*Top Inline Selections:*\n"
-        
-        if top_inline:
-            for i, (query, count) in enumerate(top_inline, 1):
-                stats_text += f"{i}. {query} ({count}x)\n"
-        else:
-            stats_text += "_No data yet_\n"
+        lines = [
+            "📊 *Bot Statistics*\n\n",
+            f"🔍 Total Searches: {self.total_searches}\n",
+            f"⬇️ Total Downloads: {self.total_downloads}\n\n",
+            "*Top Search Queries:*\n",
+        ]
+        lines += [
+            f"{i}. {query} ({count}x)\n" for i, (query, count) in enumerate(top_queries, 1)
+        ] or no_data
         
-        stats_text += "\n*Platform Usage:*\n"
+        lines.append("\n*Top Inline Selections:*\n")
+        lines += [
+            f"{i}. {query} ({count}x)\n" for i, (query, count) in enumerate(top_inline, 1)
+        ] or no_data
         
-        if self.platform_usage:
-            for platform, count in self.platform_usage.items():
-                stats_text += f"• {platform}: {count} downloads\n"
-        else:
-            stats_text += "_No data yet_\n"
+        lines.append("\n*Platform Usage:*\n")
+        lines += [
+            f"• {platform}: {count} downloads\n" for platform, count in self.platform_usage.items()
+        ] or no_data
         
-        return stats_text
+        return "".join(lines)
 
 
 # Global analytics instance
@@ -2,17 +2,28 @@
 Audio downloader module for the Musifyyy Bot.
 Handles downloading and converting audio from various platforms.
 """
+import asyncio
+import io
 import os
 import tempfile
 import logging
-from typing import Tuple, Optional
-import yt_dlp
+from typing import Dict, Tuple, Optional
 
-from config.settings import COOKIES_FILE, AUDIO_QUALITY, AUDIO_FORMAT
+from yt_dlp.utils import match_filter_func
+
+from config.settings import (
+    COOKIES_FILE, AUDIO_QUALITY, AUDIO_FORMAT, MAX_SOURCE_SIZE, MAX_TRACK_DURATION,
+    MAX_UPLOAD_BYTES, DOWNLOAD_TMP_ROOT, YTDLP_EXTRACTORS, ARIA2C_PATH, ARIA2C_CONNECTIONS
+)
+from core.executor import run_blocking, get_thread_ydl
 
 logger = logging.getLogger(__name__)
 
 
+class TrackRejectedError(Exception):
+    """A track that can't be sent to Telegram; the message says why, for the user."""
+
+
 class AudioDownloader:
     """Handles audio downloading and conversion."""
     
@@ -20,69 +31,163 @@ class AudioDownloader:
         self.cookies_file = COOKIES_FILE
         self.audio_quality = AUDIO_QUALITY
         self.audio_format = AUDIO_FORMAT
+        # (url, platform) -> running download, shared by concurrent requests
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
     
     def download(
         self, 
         url: str, 
         platform: str
-    ) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    ) -> Tuple[Optional[io.BytesIO], Optional[str], Optional[str]]:
         """
-        Download audio from a URL.
+        Download audio from a URL into memory.
+        
+        The converted file is read into a buffer (named after the file, so
+        Telegram gets a proper filename) before its temporary directory is
+        deleted.
         
         Args:
             url: URL to download from
             platform: Platform name (soundcloud, youtube, etc.)
             
         Returns:
-            Tuple of (file_path, track_title, artist) or (None, None, None) on error
+            Tuple of (audio_buffer, track_title, artist) or (None, None, None) on error
+            
+        Raises:
+            TrackRejectedError: The track is too long or its file too large to send
         """
-        tmpdir = tempfile.mkdtemp()
-        
-        ydl_opts = self._get_download_options(tmpdir, platform)
-        
         try:
-            logger.info(f"Downloading from {platform}: {url}")
+            logger.debug("Downloading from %s: %s", platform, url)
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            # The working directory (and everything yt-dlp/ffmpeg left in it)
+            # is removed on exit, whether the download succeeded or not.
+            # It lives on tmpfs when available, so transcoding never touches disk
+            with tempfile.TemporaryDirectory(prefix="musifyyy_", dir=DOWNLOAD_TMP_ROOT) as tmpdir:
+                ydl = get_thread_ydl(
+                    f"download:{platform}", self._get_download_options(platform)
+                )
+                ydl.params["paths"] = {"home": tmpdir}
+                
                 info = ydl.extract_info(url, download=True)
-                base_path = ydl.prepare_filename(info)
-                file_path = base_path.rsplit('.', 1)[0] + f'.{self.audio_format}'
+                if "requested_downloads" not in info:
+                    # Rejected by match_filter from the metadata alone
+                    logger.info("Skipped download, track too long: %s", url)
+                    raise TrackRejectedError(
+                        f"track longer than {MAX_TRACK_DURATION // 60} min"
+                    )
+                
+                # Final path after postprocessing (the extension depends on
+                # whether the audio was converted)
+                file_path = info["requested_downloads"][-1]["filepath"]
                 track_title = info.get("title", "Audio Track")
                 artist = info.get("artist") or info.get("uploader", "Unknown Artist")
+                
+                with open(file_path, "rb") as audio_file:
+                    # Telegram would reject it only after the whole upload
+                    size = os.fstat(audio_file.fileno()).st_size
+                    if size > MAX_UPLOAD_BYTES:
+                        logger.warning("Skipped upload, file too large (%s bytes): %s", size, url)
+                        raise TrackRejectedError(
+                            f"file larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+                        )
+                    audio = io.BytesIO(audio_file.read())
+                audio.name = os.path.basename(file_path)
             
-            logger.info(f"Download complete: {file_path}")
-            return file_path, track_title, artist
+            logger.info("Download complete: %s", audio.name)
+            return audio, track_title, artist
             
+        except TrackRejectedError:
+            raise
         except Exception as e:
-            logger.error(f"Download error: {e}")
+            logger.error("Download error: %s", e)
             return None, None, None
     
-    def _get_download_options(self, output_dir: str, platform: str) -> dict:
+    async def download_async(
+        self, 
+        url: str, 
+        platform: str
+    ) -> Tuple[Optional[io.BytesIO], Optional[str], Optional[str]]:
+        """
+        Run download() in the worker pool without blocking the event loop.
+        
+        Concurrent requests for the same track share one download; each
+        caller gets its own buffer over the same bytes. Raises
+        TrackRejectedError like download().
+        """
+        key = (url, platform)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(run_blocking(self.download, url, platform))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        
+        # Shielded: one caller giving up must not cancel the others' download
+        audio, track_title, artist = await asyncio.shield(task)
+        if audio is None:
+            return None, None, None
+        
+        # getvalue() and the new BytesIO share the bytes object, no copy
+        own_audio = io.BytesIO(audio.getvalue())
+        own_audio.name = audio.name
+        return own_audio, track_title, artist
+    
+    def _get_download_options(self, platform: str) -> dict:
         """
         Get yt-dlp download options based on platform.
         
+        The output directory is not part of the options: download() points
+        the reused YoutubeDL at a fresh directory via params["paths"].
+        
         Args:
-            output_dir: Directory to save downloaded files
             platform: Platform name
             
         Returns:
             Dictionary of yt-dlp options
         """
+        # Streams known to be too big for Telegram are never picked, so a track
+        # with no small enough stream fails before anything is downloaded
+        # (unknown sizes still pass)
+        fits = f"[filesize<?{MAX_SOURCE_SIZE}]"
         opts = {
-            "format": "bestaudio/best",
-            "outtmpl": os.path.join(output_dir, "%(title)s.%(ext)s"),
-            "quiet": False,
-            "no_warnings": False,
+            # Prefer streams Telegram plays as-is, so they need no re-encode
+            "format": (
+                f"bestaudio[ext=m4a]{fits}/bestaudio[ext=mp3]{fits}/bestaudio{fits}"
+                f"/best{fits}"
+            ),
+            "outtmpl": "%(title)s.%(ext)s",
+            "quiet": True,
+            "no_warnings": True,
+            "noprogress": True,
             "noplaylist": True,
+            # Checked before any format is downloaded; tracks without a known
+            # duration are let through
+            "match_filter": match_filter_func(f"duration <=? {MAX_TRACK_DURATION}"),
+            "allowed_extractors": YTDLP_EXTRACTORS,
             "postprocessors": [{
                 "key": "FFmpegExtractAudio",
-                "preferredcodec": self.audio_format,
+                # m4a/mp3 are kept as-is, anything else is converted
+                "preferredcodec": f"m4a>m4a/mp3>mp3/{self.audio_format}",
                 "preferredquality": self.audio_quality,
             }],
+            # One encoder thread per transcode: several run side by side,
+            # so extra threads per ffmpeg only add memory and contention
+            "postprocessor_args": {"extractaudio": ["-threads", "1"]},
             "prefer_ffmpeg": True,
             "keepvideo": False
         }
         
+        # Fetch plain HTTP(S) media in parallel ranges; HLS/DASH stay with yt-dlp
+        if ARIA2C_PATH:
+            opts["external_downloader"] = {"http": ARIA2C_PATH}
+            opts["external_downloader_args"] = {
+                "aria2c": [
+                    "-x", str(ARIA2C_CONNECTIONS),
+                    "-s", str(ARIA2C_CONNECTIONS),
+                    "-k", "1M",
+                    "--file-allocation=none",
+                ]
+            }
+        
         # Platform-specific options
         if platform == "youtube":
             opts["extractor_args"] = {
@@ -95,22 +200,6 @@ class AudioDownloader:
                 opts["cookiefile"] = self.cookies_file
         
         return opts
-    
-    @staticmethod
-    def cleanup_files(*file_paths: str):
-        """
-        Clean up downloaded files.
-        
-        Args:
-            *file_paths: Variable number of file paths to delete
-        """
-        for file_path in file_paths:
-            if file_path and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    logger.debug(f"Cleaned up: {file_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to cleanup {file_path}: {e}")
 
 
 # Global downloader instance
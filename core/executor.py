@@ -0,0 +1,78 @@
+"""
+Shared worker pool for the Musifyyy Bot.
+Runs blocking yt-dlp and SQLite calls off the asyncio event loop.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+import yt_dlp
+
+from config.settings import MAX_WORKERS
+
+
+# Bounded pool so a burst of searches/downloads can't spawn unlimited threads
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="musifyyy")
+
+# A single thread owns the cache database: writes stay in order, the shared
+# connection is never used by two threads at once, and lookups don't queue
+# behind downloads in the pool above
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="musifyyy-db")
+
+# Per-thread YoutubeDL instances (yt-dlp objects are not safe to share between threads)
+_thread_state = threading.local()
+
+
+def get_thread_ydl(key: str, opts: dict) -> yt_dlp.YoutubeDL:
+    """
+    Get the calling thread's long-lived YoutubeDL for a given option set.
+    
+    Building a YoutubeDL loads extractors and cookies, so each worker
+    thread builds one per key on first use and reuses it afterwards.
+    
+    Args:
+        key: Name of the option set (e.g. "search:youtube")
+        opts: yt-dlp options, only used when the instance is first created
+        
+    Returns:
+        YoutubeDL instance owned by the current thread
+    """
+    instances = getattr(_thread_state, "instances", None)
+    if instances is None:
+        instances = _thread_state.instances = {}
+    
+    ydl = instances.get(key)
+    if ydl is None:
+        ydl = instances[key] = yt_dlp.YoutubeDL(opts)
+    return ydl
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking function in the shared worker pool.
+    
+    Args:
+        func: Synchronous callable to run
+        *args, **kwargs: Arguments passed to the callable
+        
+    Returns:
+        Whatever the callable returns
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_db(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking database function on the database thread.
+    
+    Args:
+        func: Synchronous callable to run
+        *args, **kwargs: Arguments passed to the callable
+        
+    Returns:
+        Whatever the callable returns
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(func, *args, **kwargs))
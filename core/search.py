@@ -2,149 +2,210 @@
 Multi-platform music search engine for the Musifyyy Bot.
 Searches across SoundCloud, YouTube, and other music platforms.
 """
+import asyncio
 import logging
+import weakref
 from typing import List, Tuple
-import yt_dlp
 
-from config.settings import COOKIES_FILE
+from config.settings import (
+    COOKIES_FILE, SEARCH_SOCKET_TIMEOUT, QUERY_CACHE_EMPTY_TTL, YTDLP_EXTRACTORS
+)
+from core.executor import run_blocking, get_thread_ydl
+from utils.helpers import query_cache, normalize_query
 
 logger = logging.getLogger(__name__)
 
+# Searchable platforms, in result priority order
+SEARCH_PLATFORMS = {
+    "soundcloud": {
+        "name": "SoundCloud",
+        "search_prefix": "scsearch",
+        "default_search": "auto",
+        "emoji": "🎵",
+        "id_url": None,
+    },
+    "youtube": {
+        "name": "YouTube",
+        "search_prefix": "ytsearch",
+        "default_search": "ytsearch",
+        "emoji": "📺",
+        "id_url": "https://www.youtube.com/watch?v={}",
+    },
+}
+
 
 class MusicSearchEngine:
     """Handles music search across multiple platforms."""
     
     def __init__(self):
         self.cookies_file = COOKIES_FILE
+        # cache key -> lock, so concurrent misses for one query share a single search
+        self._query_locks = weakref.WeakValueDictionary()
     
-    def search(self, query: str, n: int = 30) -> List[Tuple[str, str, str]]:
+    async def search_async(self, query: str, n: int = 30) -> List[Tuple[str, str, str]]:
+        """
+        Search without blocking the event loop, reusing recent results.
+        
+        Near-duplicate queries (see normalize_query) are served from the
+        process-wide query cache; concurrent misses for the same query wait
+        for a single search instead of each starting their own.
         """
-        Search for music across multiple platforms.
+        key = (normalize_query(query), n)
+        results = query_cache.get(key)
+        if results is not None:
+            return results
         
-        Args:
-            query: Search query string
-            n: Number of results to return (default 30 for pagination)
+        lock = self._query_locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._query_locks[key] = lock
+        
+        async with lock:
+            results = query_cache.get(key)
+            if results is not None:
+                return results
             
-        Returns:
-            List of tuples: (title, url, platform)
+            results, complete = await self._search_parallel(query, n)
+            # A platform that failed may have had results, so only complete
+            # answers are cached. Misses are remembered too, briefly, so a
+            # retyped typo doesn't hit yt-dlp again.
+            if complete:
+                query_cache.store(key, results, ttl=None if results else QUERY_CACHE_EMPTY_TTL)
+            return results
+    
+    async def _search_parallel(
+        self,
+        query: str,
+        n: int
+    ) -> Tuple[List[Tuple[str, str, str]], bool]:
         """
-        logger.info(f"Searching for: {query} (requesting {n} results)")
+        Query SoundCloud and YouTube at the same time and merge the results.
         
-        all_results = []
+        SoundCloud results come first; YouTube fills the remaining slots,
+        skipping URLs already present. If SoundCloud alone returns n
+        results, the YouTube search is cancelled instead of awaited.
         
-        # Try SoundCloud first - get more results
-        soundcloud_results = self._search_soundcloud(query, n)
-        all_results.extend(soundcloud_results)
+        Returns:
+            Tuple of (results, complete); complete is False if a platform
+            search failed, so the results may be missing some
+        """
+        logger.info("Searching for: %s (requesting %s results)", query, n)
         
-        # If we have enough results, return them
-        if len(all_results) >= n:
-            logger.info(f"Total results: {len(all_results[:n])}")
-            return all_results[:n]
+        # All platforms start now; SEARCH_PLATFORMS order is the merge priority
+        tasks = [
+            asyncio.ensure_future(run_blocking(self._search_platform, platform, query, n))
+            for platform in SEARCH_PLATFORMS
+        ]
         
-        # Try YouTube as fallback to fill remaining slots
-        remaining = n - len(all_results)
-        youtube_results = self._search_youtube(query, remaining)
-        all_results.extend(youtube_results)
+        all_results = []
+        seen_urls = set()
+        complete = True
+        try:
+            for task in tasks:
+                if len(all_results) >= n:
+                    break
+                try:
+                    platform_results = await task
+                except Exception:
+                    # Already logged by _search_platform
+                    complete = False
+                    continue
+                for result in platform_results:
+                    if len(all_results) >= n:
+                        break
+                    if result[1] not in seen_urls:
+                        seen_urls.add(result[1])
+                        all_results.append(result)
+        finally:
+            # Frees the worker slot if the search hasn't started yet; a running
+            # yt-dlp call finishes in the background and its result is dropped
+            for task in tasks:
+                task.cancel()
         
-        logger.info(f"Total results: {len(all_results)}")
-        return all_results[:n] if all_results else []
+        logger.info("Total results: %s", len(all_results))
+        return all_results, complete
     
-    def _search_soundcloud(self, query: str, n: int) -> List[Tuple[str, str, str]]:
-        """Search SoundCloud for music."""
+    def _search_platform(self, platform: str, query: str, n: int) -> List[Tuple[str, str, str]]:
+        """
+        Search one platform from SEARCH_PLATFORMS for music.
+        
+        Raises:
+            Exception: The search itself failed (network, extractor); an
+                empty list means the platform answered with no results
+        """
+        spec = SEARCH_PLATFORMS[platform]
         results = []
         
         try:
-            logger.info("Searching SoundCloud...")
-            opts = {
-                "quiet": True,
-                "extract_flat": "in_playlist",
-                "default_search": "auto",
-                "ignoreerrors": True,
-            }
-            
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                info = ydl.extract_info(f"scsearch{n}:{query}", download=False)
+            logger.info("Searching %s...", spec["name"])
+            ydl = get_thread_ydl(f"search:{platform}", self._get_search_options(platform))
+            ydl.params["playlist_items"] = f"1-{n}"
+            info = ydl.extract_info(f"{spec['search_prefix']}{n}:{query}", download=False)
             
             if info and "entries" in info:
                 for entry in info["entries"]:
                     if not entry:
                         continue
                     
-                    title = entry.get("title", "Unknown title")
-                    url = entry.get("url") or entry.get("webpage_url") or entry.get("id")
+                    get = entry.get
+                    title = get("title", "Unknown title")
+                    url = get("url") or get("webpage_url") or get("id")
+                    
+                    # Ensure the URL is complete (flat entries may carry a bare id)
+                    if url and spec["id_url"] and not url.startswith("http"):
+                        url = spec["id_url"].format(url)
                     
                     if url and title != "Unknown title":
                         # Format title with duration
                         formatted_title = self._format_title(
                             title, 
-                            entry.get("duration"),
-                            "🎵"
+                            get("duration"),
+                            spec["emoji"]
                         )
-                        results.append((formatted_title, url, "soundcloud"))
+                        results.append((formatted_title, url, platform))
+                        if len(results) >= n:
+                            break
             
-            logger.info(f"SoundCloud: Found {len(results)} results")
+            logger.info("%s: Found %s results", spec["name"], len(results))
         except Exception as e:
-            logger.warning(f"SoundCloud search failed: {e}")
+            logger.warning("%s search failed: %s", spec["name"], e)
+            raise
         
         return results
     
-    def _search_youtube(self, query: str, n: int) -> List[Tuple[str, str, str]]:
-        """Search YouTube for music."""
-        results = []
+    def _get_search_options(self, platform: str) -> dict:
+        """Get yt-dlp flat-search options for a platform."""
+        opts = {
+            "quiet": True,
+            "no_warnings": True,
+            "extract_flat": True,
+            "skip_download": True,
+            "socket_timeout": SEARCH_SOCKET_TIMEOUT,
+            "allowed_extractors": YTDLP_EXTRACTORS,
+            "default_search": SEARCH_PLATFORMS[platform]["default_search"],
+            # Errors must raise: with ignoreerrors a failed search looks like
+            # one with no results, and would be cached as such
+            "ignoreerrors": False,
+        }
         
-        try:
-            logger.info("Searching YouTube...")
-            opts = {
-                "quiet": True,
-                "extract_flat": "in_playlist",
-                "default_search": "ytsearch",
-                "ignoreerrors": True,
-                "extractor_args": {
-                    "youtube": {
-                        "player_client": ["ios", "web"],
-                    }
+        if platform == "youtube":
+            # Flat search needs titles/URLs only; the web client is
+            # reserved for downloads
+            opts["extractor_args"] = {
+                "youtube": {
+                    "player_client": ["ios"],
                 }
             }
-            
             if self.cookies_file:
                 opts["cookiefile"] = self.cookies_file
-            
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                info = ydl.extract_info(f"ytsearch{n}:{query}", download=False)
-            
-            if info and "entries" in info:
-                for entry in info["entries"]:
-                    if not entry:
-                        continue
-                    
-                    title = entry.get("title", "Unknown title")
-                    url = entry.get("url") or entry.get("webpage_url") or entry.get("id")
-                    
-                    # Ensure YouTube URL is complete
-                    if url and not url.startswith("http"):
-                        url = f"https://www.youtube.com/watch?v={url}"
-                    
-                    if url and title != "Unknown title":
-                        # Format title with duration
-                        formatted_title = self._format_title(
-                            title, 
-                            entry.get("duration"),
-                            "📺"
-                        )
-                        results.append((formatted_title, url, "youtube"))
-            
-            logger.info(f"YouTube: Found {len(results)} results")
-        except Exception as e:
-            logger.warning(f"YouTube search failed: {e}")
         
-        return results
+        return opts
     
     @staticmethod
     def _format_title(title: str, duration: int, emoji: str) -> str:
         """Format title with duration and emoji."""
         if duration:
-            mins = int(duration // 60)
-            secs = int(duration % 60)
+            mins, secs = divmod(int(duration), 60)
             return f"{emoji} {title} ({mins}:{secs:02d})"
         return f"{emoji} {title}"
 
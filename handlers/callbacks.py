@@ -2,94 +2,143 @@
 Callback query handlers for the Musifyyy Bot.
 Handles button clicks and downloads from search results.
 """
+import asyncio
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import re
+import weakref
+from typing import Set, Tuple
+from telegram import Update
 from telegram.ext import ContextTypes
 
-from core.downloader import downloader
+from core.downloader import downloader, TrackRejectedError
 from core.analytics import analytics
-from utils.helpers import search_cache, format_platform_summary, truncate_title
-from config.settings import RESULTS_PER_PAGE
+from utils.helpers import search_cache, file_id_cache, short_error, markdown_safe
+from handlers.results import show_results_page
 
 logger = logging.getLogger(__name__)
 
+# chat_id -> lock; entries disappear once no handler holds or awaits the lock
+_chat_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# (chat_id, callback_data) of clicks being handled or waiting for the chat lock
+_pending_clicks: Set[Tuple[int, str]] = set()
+
+# "page_<search_id>_<page>" / "download_<search_id>_<index>", see handlers.results
+_CALLBACK_RE = re.compile(r"(page|download)_([0-9a-f]+)_(\d+)")
+
+
+def _get_chat_lock(chat_id: int) -> asyncio.Lock:
+    """Get the lock that serializes callback handling within a chat."""
+    lock = _chat_locks.get(chat_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _chat_locks[chat_id] = lock
+    return lock
+
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks - download selected track or navigate pages."""
     query = update.callback_query
-    await query.answer()
+    if query.data == "page_info":
+        # Static page indicator: let the client cache the empty answer
+        await query.answer(cache_time=3600)
+        return
+    
+    chat = update.effective_chat
+    chat_id = chat.id if chat else update.effective_user.id
     
+    # Repeated taps on a button whose click is still in progress are dropped,
+    # so a double tap doesn't download and send the same track twice
+    click = (chat_id, query.data)
+    if click in _pending_clicks:
+        await query.answer("⏳ Already on it...")
+        return
+    # Claimed before any await, so a tap arriving meanwhile sees it
+    _pending_clicks.add(click)
+    
+    try:
+        await query.answer()
+        
+        # Keep clicks ordered within a chat while other chats proceed in parallel
+        async with _get_chat_lock(chat_id):
+            await _handle_button(query)
+    finally:
+        _pending_clicks.discard(click)
+
+
+async def _handle_button(query):
+    """Navigate result pages or download the selected track."""
     callback_data = query.data
-    user_id = update.effective_user.id
+    match = _CALLBACK_RE.fullmatch(callback_data)
+    if match is None:
+        # Also buttons from before search ids existed
+        logger.warning("Unrecognized callback data: %s", callback_data)
+        if callback_data.startswith("page_"):
+            await query.edit_message_text("❌ Search expired. Please search again.")
+        else:
+            await query.edit_message_text("❌ Invalid selection. Please search again.")
+        return
+    
+    action, search_id, index = match.groups()
     
     # Handle pagination
-    if callback_data.startswith("page_"):
-        if callback_data == "page_info":
-            # Just show current page info, do nothing
+    if action == "page":
+        # Get cached results
+        results = await search_cache.get(search_id)
+        if not results:
+            await query.edit_message_text("❌ Search expired. Please search again.")
             return
         
-        try:
-            page = int(callback_data.split("_")[1])
-            
-            # Get cached results
-            if not search_cache.has(user_id):
-                await query.edit_message_text("❌ Search expired. Please search again.")
-                return
-            
-            results = search_cache.get(user_id)
-            await _show_results_page(query.message, results, page)
-            return
-            
-        except (ValueError, IndexError) as e:
-            logger.error(f"Page navigation error: {e}")
-            return
+        await show_results_page(query.message, search_id, results, int(index))
+        return
     
-    # Handle download
-    if callback_data.startswith("download_"):
-        try:
-            track_index = int(callback_data.split("_")[1])
-        except (ValueError, IndexError):
-            await query.edit_message_text("❌ Invalid selection. Please search again.")
-            return
-    else:
-        # Legacy support for old format (just numbers)
-        try:
-            track_index = int(callback_data)
-        except ValueError:
-            await query.edit_message_text("❌ Invalid selection. Please search again.")
-            return
+    track_index = int(index)
     
     # Download the track
-    try:
-        user_id = update.effective_user.id
-        
-        # Check if user has cached results
-        if not search_cache.has(user_id):
-            await query.edit_message_text("❌ Track not found. Please search again.")
-            return
-        
-        results = search_cache.get(user_id)
-        
-        if track_index >= len(results):
-            await query.edit_message_text("❌ Track not found. Please search again.")
-            return
-        
-        title, url, platform = results[track_index]
-        
-    except (ValueError, KeyError):
-        await query.edit_message_text("❌ Invalid selection. Please search again.")
+    results = await search_cache.get(search_id)
+    if not results or track_index >= len(results):
+        await query.edit_message_text("❌ Track not found. Please search again.")
         return
     
-    logger.info(f"Download requested from {platform}: {url}")
-    status = await query.edit_message_text(f"⏳ Downloading from {platform}...")
+    title, url, platform = results[track_index]
+    
+    logger.info("Download requested from %s: %s", platform, url)
     
     # Track download
     analytics.track_download(platform)
     
+    # Already sent once - Telegram can resend it by file_id, no download needed
+    cached = await file_id_cache.get(url)
+    if cached:
+        file_id, track_title, artist = cached
+        try:
+            await _reply_audio(query.message, file_id, track_title, artist, platform)
+        except Exception as e:
+            logger.warning("Cached file_id failed, downloading again: %s", e)
+        else:
+            # The audio is out; a failed status edit must not trigger a resend
+            try:
+                await query.edit_message_text(
+                    f"✅ Sent: *{markdown_safe(track_title)}*\n📍 From: {platform.title()}", 
+                    parse_mode="Markdown"
+                )
+            except Exception as e:
+                logger.warning("Could not update status message: %s", e)
+            return
+    
+    status = await query.edit_message_text(f"⏳ Downloading from {platform}...")
+    
     # Download the audio
-    file_path, track_title, artist = downloader.download(url, platform)
+    try:
+        audio, track_title, artist = await downloader.download_async(url, platform)
+    except TrackRejectedError as e:
+        await status.edit_text(
+            f"⚠️ Can't send this track: {e}.\n\n"
+            "Try another track or search again."
+        )
+        return
     
-    if not file_path:
+    if not audio:
         await status.edit_text(
             f"⚠️ Couldn't download from {platform}.\n\n"
             "Try another track or search again."
@@ -98,71 +147,30 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Send the audio file
     try:
-        with open(file_path, "rb") as audio_file:
-            await query.message.reply_audio(
-                audio=audio_file,
-                title=track_title,
-                performer=artist,
-                caption=f"🎵 {track_title}\n📍 Source: {platform.title()}"
-            )
+        sent = await _reply_audio(query.message, audio, track_title, artist, platform)
+        
+        await file_id_cache.store(url, (sent.audio.file_id, track_title, artist))
         
         await status.edit_text(
-            f"✅ Sent: *{track_title}*\n📍 From: {platform.title()}", 
+            f"✅ Sent: *{markdown_safe(track_title)}*\n📍 From: {platform.title()}", 
             parse_mode="Markdown"
         )
         
-        # Cleanup
-        downloader.cleanup_files(file_path)
-        
     except Exception as e:
-        logger.error(f"Failed to send audio: {e}")
-        await status.edit_text(f"⚠️ Downloaded but couldn't send: {str(e)[:50]}")
+        logger.error("Failed to send audio: %s", e)
+        await status.edit_text(f"⚠️ Downloaded but couldn't send: {short_error(e, 50)}")
 
 
-async def _show_results_page(message, results: list, page: int):
-    """Display a paginated page of search results."""
-    total_results = len(results)
-    total_pages = (total_results + RESULTS_PER_PAGE - 1) // RESULTS_PER_PAGE
-    
-    # Calculate start and end indices for this page
-    start_idx = page * RESULTS_PER_PAGE
-    end_idx = min(start_idx + RESULTS_PER_PAGE, total_results)
-    
-    # Create buttons for tracks on this page
-    buttons = []
-    for i in range(start_idx, end_idx):
-        title, url, platform = results[i]
-        display_title = truncate_title(title)
-        buttons.append([
-            InlineKeyboardButton(display_title, callback_data=f"download_{i}")
-        ])
-    
-    # Add navigation buttons
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"page_{page-1}"))
-    
-    nav_buttons.append(InlineKeyboardButton(f"📄 {page+1}/{total_pages}", callback_data="page_info"))
-    
-    if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"page_{page+1}"))
-    
-    if nav_buttons:
-        buttons.append(nav_buttons)
-    
-    # Format summary
-    summary = format_platform_summary(results)
-    
-    await message.edit_text(
-        f"🎵 *Found {total_results} tracks*\n"
-        f"_{summary}_\n\n"
-        f"📄 Page {page+1}/{total_pages} (showing {start_idx+1}-{end_idx})\n\n"
-        "Choose a track to download:",
-        reply_markup=InlineKeyboardMarkup(buttons),
-        parse_mode="Markdown"
+async def _reply_audio(message, audio, track_title: str, artist: str, platform: str):
+    """Send audio (in-memory buffer or Telegram file_id) as a reply."""
+    return await message.reply_audio(
+        audio=audio,
+        title=track_title,
+        performer=artist,
+        caption=f"🎵 {track_title}\n📍 Source: {platform.title()}"
     )
 
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Log errors."""
-    logger.error(f"Update {update} caused error {context.error}")
+    logger.error("Update %s caused error %s", update, context.error)
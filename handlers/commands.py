@@ -2,15 +2,17 @@
 Command handlers for the Musifyyy Bot.
 Handles /start and /stats commands.
 """
+import asyncio
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update
 from telegram.ext import ContextTypes
 
 from core.search import search_engine
 from core.analytics import analytics
-from utils.helpers import search_cache, format_platform_summary, truncate_title
+from utils.helpers import search_cache, short_error, markdown_safe
 from utils.database import user_db
-from config.settings import SEARCH_RESULTS_TOTAL, RESULTS_PER_PAGE, ADMIN_USER_IDS
+from handlers.results import show_results_page
+from config.settings import SEARCH_RESULTS_TOTAL, ADMIN_USER_IDS, BROADCAST_CONCURRENCY
 
 logger = logging.getLogger(__name__)
 
@@ -18,10 +20,10 @@ logger = logging.getLogger(__name__)
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command."""
     user = update.effective_user
-    logger.info(f"Start command received from user {user.id}")
+    logger.info("Start command received from user %s", user.id)
     
     # Add user to database
-    user_db.add_user(user.id, user.username, user.first_name)
+    await user_db.add_user(user.id, user.username, user.first_name)
     
     await update.message.reply_text(
         "🎵 *Music Downloader Bot*\n\n"
@@ -39,19 +41,16 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages - search for music."""
-    query = (update.message.text or "").strip()
-    
-    # Ignore commands
-    if not query or query.startswith("/"):
-        return
+    # Empty/punctuation-only text and commands are rejected by SEARCH_FILTER
+    query = update.message.text.strip()
     
     # Track user activity
     user = update.effective_user
-    user_db.add_user(user.id, user.username, user.first_name)
+    await user_db.add_user(user.id, user.username, user.first_name)
     
-    logger.info(f"Search query received: {query}")
+    logger.info("Search query received: %s", query)
     msg = await update.message.reply_text(
-        f"🔍 Searching across platforms for *{query}*...", 
+        f"🔍 Searching across platforms for *{markdown_safe(query)}*...", 
         parse_mode="Markdown"
     )
     
@@ -60,7 +59,7 @@ async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
         analytics.track_search(query)
         
         # Perform search - get all results (30)
-        results = search_engine.search(query, n=SEARCH_RESULTS_TOTAL)
+        results = await search_engine.search_async(query, n=SEARCH_RESULTS_TOTAL)
         
         if not results:
             await msg.edit_text(
@@ -74,61 +73,15 @@ async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        # Store results in cache
-        user_id = update.effective_user.id
-        search_cache.store(user_id, results)
+        # Store results in cache; buttons refer to them by search id
+        search_id = await search_cache.add(results)
         
         # Show first page (5 results)
-        await _show_results_page(msg, results, page=0, query=query)
+        await show_results_page(msg, search_id, results, page=0)
         
     except Exception as e:
-        logger.error(f"Search handler error: {e}")
-        await msg.edit_text(f"⚠️ Error: {str(e)[:100]}")
-
-
-async def _show_results_page(message, results: list, page: int, query: str):
-    """Display a paginated page of search results."""
-    total_results = len(results)
-    total_pages = (total_results + RESULTS_PER_PAGE - 1) // RESULTS_PER_PAGE
-    
-    # Calculate start and end indices for this page
-    start_idx = page * RESULTS_PER_PAGE
-    end_idx = min(start_idx + RESULTS_PER_PAGE, total_results)
-    page_results = results[start_idx:end_idx]
-    
-    # Create buttons for tracks on this page
-    buttons = []
-    for i in range(start_idx, end_idx):
-        title, url, platform = results[i]
-        display_title = truncate_title(title)
-        buttons.append([
-            InlineKeyboardButton(display_title, callback_data=f"download_{i}")
-        ])
-    
-    # Add navigation buttons
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"page_{page-1}"))
-    
-    nav_buttons.append(InlineKeyboardButton(f"📄 {page+1}/{total_pages}", callback_data="page_info"))
-    
-    if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"page_{page+1}"))
-    
-    if nav_buttons:
-        buttons.append(nav_buttons)
-    
-    # Format summary
-    summary = format_platform_summary(results)
-    
-    await message.edit_text(
-        f"🎵 *Found {total_results} tracks*\n"
-        f"_{summary}_\n\n"
-        f"📄 Page {page+1}/{total_pages} (showing {start_idx+1}-{end_idx})\n\n"
-        "Choose a track to download:",
-        reply_markup=InlineKeyboardMarkup(buttons),
-        parse_mode="Markdown"
-    )
+        logger.error("Search handler error: %s", e)
+        await msg.edit_text(f"⚠️ Error: {short_error(e)}")
 
 
 async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -173,28 +126,23 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="Markdown"
     )
     
-    # Send to all users
-    success_count = 0
-    failed_count = 0
-    blocked_count = 0
+    # Send to all users, several at a time; AIORateLimiter keeps the overall
+    # pace under Telegram's limit and retries after flood waits
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    text = f"📢 *Message from Musifyyy Bot*\n\n{broadcast_text}"
+    outcomes = await asyncio.gather(*(
+        _send_broadcast(context.bot, user_id, text, semaphore) for user_id in all_users
+    ))
     
-    for user_id in all_users:
-        try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=f"📢 *Message from Musifyyy Bot*\n\n{broadcast_text}",
-                parse_mode="Markdown"
-            )
-            success_count += 1
-        except Exception as e:
-            error_msg = str(e).lower()
-            if "blocked" in error_msg or "user is deactivated" in error_msg:
-                blocked_count += 1
-                # Remove blocked users from database
-                user_db.remove_user(user_id)
-            else:
-                failed_count += 1
-            logger.warning(f"Failed to send broadcast to {user_id}: {e}")
+    # Blocked users are dropped together, in a single database write
+    for recipient_id, outcome in zip(all_users, outcomes):
+        if outcome == "blocked":
+            user_db.remove_user(recipient_id)
+    await user_db.flush()
+    
+    success_count = outcomes.count("sent")
+    blocked_count = outcomes.count("blocked")
+    failed_count = outcomes.count("failed")
     
     # Send summary
     await confirm_msg.edit_text(
@@ -207,7 +155,26 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode="Markdown"
     )
     
-    logger.info(f"Broadcast completed: {success_count}/{total_users} successful")
+    logger.info("Broadcast completed: %s/%s successful", success_count, total_users)
+
+
+async def _send_broadcast(bot, user_id: int, text: str, semaphore: asyncio.Semaphore) -> str:
+    """
+    Send the broadcast to one user.
+    
+    Returns:
+        "sent", "blocked" (user blocked the bot or is deactivated) or "failed"
+    """
+    async with semaphore:
+        try:
+            await bot.send_message(chat_id=user_id, text=text, parse_mode="Markdown")
+            return "sent"
+        except Exception as e:
+            logger.warning("Failed to send broadcast to %s: %s", user_id, e)
+            error_msg = str(e).lower()
+            if "blocked" in error_msg or "user is deactivated" in error_msg:
+                return "blocked"
+            return "failed"
 
 
 async def users(update: Update, context: ContextTypes.DEFAULT_TYPE):
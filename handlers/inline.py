@@ -2,93 +2,143 @@
 Inline mode handlers for the Musifyyy Bot.
 Handles inline queries and chosen inline results.
 """
+import asyncio
 import logging
-from uuid import uuid4
+import secrets
+from typing import Dict, Union
 from telegram import (
     Update, 
     InlineQueryResultArticle, 
+    InlineQueryResultCachedAudio,
     InputTextMessageContent,
     InputMediaAudio
 )
 from telegram.ext import ContextTypes
 
 from core.search import search_engine
-from core.downloader import downloader
+from core.downloader import downloader, TrackRejectedError
 from core.analytics import analytics
-from utils.helpers import inline_result_cache, clean_title
+from utils.helpers import (
+    inline_result_cache, file_id_cache, clean_title, short_error, markdown_safe
+)
 from utils.database import user_db
+from config.settings import INLINE_DEBOUNCE_SECONDS, INLINE_CACHE_TIME, INLINE_RESULT_ID_BYTES
 
 logger = logging.getLogger(__name__)
 
+# user_id -> id of the newest inline query, so superseded keystrokes can bail out
+_latest_inline_query: Dict[int, str] = {}
+
+PLATFORM_EMOJI = {"soundcloud": "🎵", "youtube": "📺"}
+
+INLINE_MESSAGE_TEMPLATE = (
+    "{emoji} *{title}*\n\n"
+    "🎵 Downloading from {platform}...\n"
+    "⏳ Please wait, this may take a moment."
+)
+
+INLINE_SENT_TEMPLATE = (
+    "{emoji} *{title}*\n\n"
+    "✅ Downloaded! Check your chat with @musifyyyybot\n"
+    "📍 Source: {platform}"
+)
+
 
 async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle inline queries - show search results in dropdown."""
+    # Queries shorter than 3 characters are rejected by INLINE_QUERY_PATTERN
     query = update.inline_query.query
     
     # Track user activity
     user = update.inline_query.from_user
-    user_db.add_user(user.id, user.username, user.first_name)
+    await user_db.add_user(user.id, user.username, user.first_name)
     
-    # Require at least 3 characters
-    if not query or len(query) < 3:
+    # Debounce: Telegram sends a query per keystroke, only search once typing pauses
+    inline_query_id = update.inline_query.id
+    _latest_inline_query[user.id] = inline_query_id
+    await asyncio.sleep(INLINE_DEBOUNCE_SECONDS)
+    if _latest_inline_query.get(user.id) != inline_query_id:
         return
+    del _latest_inline_query[user.id]
     
-    logger.info(f"Inline query received: {query}")
+    logger.info("Inline query received: %s", query)
     
     try:
         # Track search
         analytics.track_search(query)
         
         # Perform search
-        results = search_engine.search(query, n=10)
+        results = await search_engine.search_async(query, n=10)
         
         if not results:
             return
         
-        # Build inline results
-        inline_results = []
-        
-        for title, url, platform in results:
-            result_id = str(uuid4())
-            
-            # Store result info for later tracking
-            inline_result_cache.store(result_id, {
-                "title": title,
-                "url": url,
-                "platform": platform,
-                "query": query
-            })
-            
-            # Extract clean title
-            title_clean = clean_title(title)
-            platform_emoji = "🎵" if platform == "soundcloud" else "📺"
-            
-            # Create inline result as ARTICLE
-            inline_result = InlineQueryResultArticle(
-                id=result_id,
-                title=title_clean,
-                description=f"From {platform} - Tap to send",
-                input_message_content=InputTextMessageContent(
-                    message_text=f"{platform_emoji} *{title_clean}*\n\n"
-                                f"🎵 Downloading from {platform}...\n"
-                                f"⏳ Please wait, this may take a moment.",
-                    parse_mode="Markdown"
-                )
-            )
-            
-            inline_results.append(inline_result)
+        # Build inline results (their file_id lookups run concurrently)
+        inline_results = await asyncio.gather(*(
+            _build_inline_result(title, url, platform, query)
+            for title, url, platform in results
+        ))
         
         # Answer inline query
         await update.inline_query.answer(
             inline_results,
-            cache_time=300,
-            is_personal=True
+            # Results don't depend on the user, so Telegram may serve this answer
+            # to anyone typing the same query without asking the bot again
+            cache_time=INLINE_CACHE_TIME,
+            is_personal=False
         )
         
-        logger.info(f"Answered inline query with {len(inline_results)} results")
+        logger.info("Answered inline query with %s results", len(inline_results))
         
     except Exception as e:
-        logger.error(f"Inline query error: {e}")
+        logger.error("Inline query error: %s", e)
+
+
+async def _build_inline_result(
+    title: str, 
+    url: str, 
+    platform: str, 
+    query: str
+) -> Union[InlineQueryResultArticle, InlineQueryResultCachedAudio]:
+    """Cache one search result under a new result id and build its inline result."""
+    result_id = secrets.token_hex(INLINE_RESULT_ID_BYTES)
+    
+    # Extract clean title
+    title_clean = clean_title(title)
+    
+    # Already uploaded once: Telegram posts the audio itself when it's picked
+    cached = await file_id_cache.get(url)
+    
+    # Store result info for later tracking (title already cleaned)
+    inline_result_cache.store(result_id, {
+        "title": title_clean,
+        "url": url,
+        "platform": platform,
+        "query": query,
+        "cached": cached is not None
+    })
+    
+    if cached:
+        return InlineQueryResultCachedAudio(
+            id=result_id,
+            audio_file_id=cached[0],
+            caption="🎵 via @musifyyyybot"
+        )
+    
+    # Create inline result as ARTICLE
+    return InlineQueryResultArticle(
+        id=result_id,
+        title=title_clean,
+        description=f"From {platform} - Tap to send",
+        input_message_content=InputTextMessageContent(
+            message_text=INLINE_MESSAGE_TEMPLATE.format(
+                emoji=PLATFORM_EMOJI.get(platform, "📺"),
+                title=markdown_safe(title_clean),
+                platform=platform
+            ),
+            parse_mode="Markdown"
+        )
+    )
 
 
 async def chosen_inline_result(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -100,7 +150,7 @@ async def chosen_inline_result(update: Update, context: ContextTypes.DEFAULT_TYP
     
     # Get result details from cache
     if not inline_result_cache.has(result_id):
-        logger.warning(f"Result {result_id} not found in cache")
+        logger.warning("Result %s not found in cache", result_id)
         return
     
     result_info = inline_result_cache.get(result_id)
@@ -112,29 +162,49 @@ async def chosen_inline_result(update: Update, context: ContextTypes.DEFAULT_TYP
     analytics.track_inline_selection(query)
     analytics.track_download(platform)
     
-    logger.info(f"📊 INLINE DOWNLOAD REQUEST:")
-    logger.info(f"   User: {result.from_user.username or result.from_user.id}")
-    logger.info(f"   Query: {query}")
+    if result_info.get("cached"):
+        # The chosen result was the audio itself, nothing left to send
+        return
+    
+    logger.info(
+        "📊 Inline download request: user=%s query=%r platform=%s",
+        result.from_user.username or result.from_user.id, query, platform
+    )
     
     try:
-        # Download the audio
-        file_path, track_title, artist = downloader.download(url, platform)
+        message = None
         
-        if not file_path:
-            raise Exception("Download failed")
-        
-        logger.info(f"Download complete: {file_path}")
+        # Already uploaded once - resend by file_id, no download needed
+        cached = await file_id_cache.get(url)
+        if cached:
+            audio_file_id, track_title, artist = cached
+            try:
+                message = await context.bot.send_audio(
+                    chat_id=result.from_user.id,
+                    audio=audio_file_id,
+                    title=track_title,
+                    performer=artist
+                )
+            except Exception as e:
+                logger.warning("Cached file_id failed, downloading again: %s", e)
         
-        # Upload to Telegram and get file_id
-        with open(file_path, "rb") as audio_file:
+        if message is None:
+            # Download the audio
+            audio, track_title, artist = await downloader.download_async(url, platform)
+            
+            if not audio:
+                raise Exception("Download failed")
+            
+            # Upload to Telegram and get file_id
             message = await context.bot.send_audio(
                 chat_id=result.from_user.id,
-                audio=audio_file,
+                audio=audio,
                 title=track_title,
                 performer=artist
             )
-            
-            audio_file_id = message.audio.file_id
+            await file_id_cache.store(url, (message.audio.file_id, track_title, artist))
+        
+        audio_file_id = message.audio.file_id
         
         # Edit the inline message to show the actual audio
         try:
@@ -149,29 +219,31 @@ async def chosen_inline_result(update: Update, context: ContextTypes.DEFAULT_TYP
             )
             logger.info("Successfully edited inline message with audio")
         except Exception as e:
-            logger.error(f"Could not edit inline message with audio: {e}")
+            logger.error("Could not edit inline message with audio: %s", e)
             # Fallback: update text
-            title_clean = clean_title(title)
-            platform_emoji = "🎵" if platform == "soundcloud" else "📺"
-            
             await context.bot.edit_message_text(
                 inline_message_id=inline_message_id,
-                text=f"{platform_emoji} *{title_clean}*\n\n"
-                     f"✅ Downloaded! Check your chat with @musifyyyybot\n"
-                     f"📍 Source: {platform}",
+                text=INLINE_SENT_TEMPLATE.format(
+                    emoji=PLATFORM_EMOJI.get(platform, "📺"),
+                    title=markdown_safe(title),
+                    platform=platform
+                ),
                 parse_mode="Markdown"
             )
         
-        # Cleanup
-        downloader.cleanup_files(file_path)
-        inline_result_cache.delete(result_id)
+        # The entry is left to expire: a shared cached answer can hand the
+        # same result id to other users
         
     except Exception as e:
-        logger.error(f"Inline download failed: {e}")
+        logger.error("Inline download failed: %s", e)
+        if isinstance(e, TrackRejectedError):
+            reason = f"⚠️ Can't send this track: {e}."
+        else:
+            reason = f"⚠️ Download failed: {markdown_safe(short_error(e))}"
         try:
             await context.bot.edit_message_text(
                 inline_message_id=inline_message_id,
-                text=f"⚠️ Download failed: {str(e)[:100]}\n\n"
+                text=f"{reason}\n\n"
                      f"Try searching again with @musifyyyybot",
                 parse_mode="Markdown"
             )
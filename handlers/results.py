@@ -0,0 +1,39 @@
+"""
+Search results rendering for the Musifyyy Bot.
+Shared by the search command and the pagination callbacks.
+"""
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from utils.helpers import format_platform_summary, truncate_title, pagination_row
+from config.settings import RESULTS_PER_PAGE
+
+
+async def show_results_page(message, search_id: str, results: list, page: int):
+    """Display a paginated page of search results."""
+    total_results = len(results)
+    total_pages = (total_results + RESULTS_PER_PAGE - 1) // RESULTS_PER_PAGE
+    
+    # Calculate start and end indices for this page
+    start_idx = page * RESULTS_PER_PAGE
+    end_idx = min(start_idx + RESULTS_PER_PAGE, total_results)
+    
+    # Create buttons for tracks on this page
+    buttons = [
+        [InlineKeyboardButton(truncate_title(results[i][0]), callback_data=f"download_{search_id}_{i}")]
+        for i in range(start_idx, end_idx)
+    ]
+    
+    # Add navigation buttons (shared, immutable row per search and page)
+    buttons.append(pagination_row(search_id, page, total_pages))
+    
+    # Format summary
+    summary = format_platform_summary(results)
+    
+    await message.edit_text(
+        f"🎵 *Found {total_results} tracks*\n"
+        f"_{summary}_\n\n"
+        f"📄 Page {page+1}/{total_pages} (showing {start_idx+1}-{end_idx})\n\n"
+        "Choose a track to download:",
+        reply_markup=InlineKeyboardMarkup(buttons),
+        parse_mode="Markdown"
+    )
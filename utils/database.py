@@ -1,38 +1,102 @@
 """
 Simple user database for tracking bot subscribers.
-Stores user information in memory (can be upgraded to real DB later).
+Keeps user information in memory, written through to SQLite so
+subscribers survive restarts. Also persists uploaded tracks' Telegram
+file_ids and users' search results there. Lookups and writes that
+handlers wait on run on the database thread, off the event loop.
 """
+import json
 import logging
-from typing import Set, List, Dict
-from datetime import datetime
+import sqlite3
+import time
+from dataclasses import dataclass, asdict
+from typing import Set, List, Dict, Optional, Tuple
+
+from config.settings import (
+    CACHE_DB_PATH, FILE_ID_CACHE_TTL, USER_FLUSH_INTERVAL, USER_FLUSH_BATCH_SIZE
+)
+from core.executor import run_db
 
 logger = logging.getLogger(__name__)
 
 
+def _open_database(path: str) -> sqlite3.Connection:
+    """Open an autocommit SQLite connection tuned for small, frequent writes."""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@dataclass(slots=True)
+class UserRecord:
+    """One subscriber; slotted, since every user ever seen stays in memory."""
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    joined_at: float  # Unix timestamps; format them only when displaying
+    last_active: float
+
+
 class UserDatabase:
     """Manages bot users/subscribers."""
     
-    def __init__(self):
-        self._users: Dict[int, dict] = {}  # user_id -> user_info
+    _COLUMNS = ("user_id", "username", "first_name", "joined_at", "last_active")
+    
+    def __init__(
+        self,
+        flush_interval: float = USER_FLUSH_INTERVAL,
+        flush_batch_size: int = USER_FLUSH_BATCH_SIZE
+    ):
+        self._users: Dict[int, UserRecord] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        # Known users whose activity changed since the last flush
+        self._dirty: Set[int] = set()
+        # Users removed since the last flush
+        self._removed: Set[int] = set()
+        # Seconds between the periodic flush() calls scheduled by the app
+        self.flush_interval = flush_interval
+        # Changed users that trigger a flush before the interval is up
+        self.flush_batch_size = flush_batch_size
+    
+    def open(self, conn: sqlite3.Connection):
+        """Create the users table if needed and load the stored users."""
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, "
+                "joined_at REAL, last_active REAL)"
+            )
+            for row in conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM users"):
+                self._users[row[0]] = UserRecord(*row)
+            self._conn = conn
+            logger.info("Loaded %s users", len(self._users))
+        except sqlite3.Error as e:
+            logger.warning("User database unavailable, users won't survive restarts: %s", e)
     
-    def add_user(self, user_id: int, username: str = None, first_name: str = None):
+    async def add_user(self, user_id: int, username: str = None, first_name: str = None):
         """Add or update a user in the database."""
-        if user_id not in self._users:
-            self._users[user_id] = {
-                'user_id': user_id,
-                'username': username,
-                'first_name': first_name,
-                'joined_at': datetime.now().isoformat(),
-                'last_active': datetime.now().isoformat()
-            }
-            logger.info(f"New user added: {user_id} (@{username})")
+        now = time.time()
+        user = self._users.get(user_id)
+        is_new = user is None
+        if is_new:
+            self._users[user_id] = UserRecord(user_id, username, first_name, now, now)
+            logger.info("New user added: %s (@%s)", user_id, username)
         else:
             # Update last active time
-            self._users[user_id]['last_active'] = datetime.now().isoformat()
+            user.last_active = now
             if username:
-                self._users[user_id]['username'] = username
+                user.username = username
             if first_name:
-                self._users[user_id]['first_name'] = first_name
+                user.first_name = first_name
+        
+        # Activity updates arrive with every message, so they are batched and
+        # written by the periodic flush() or once a full batch is pending.
+        # New subscribers are written right away, they matter for broadcasts.
+        self._dirty.add(user_id)
+        self._removed.discard(user_id)
+        if is_new or len(self._dirty) >= self.flush_batch_size:
+            await self.flush()
     
     def get_all_user_ids(self) -> List[int]:
         """Get list of all user IDs."""
@@ -44,14 +108,203 @@ class UserDatabase:
     
     def get_user_info(self, user_id: int) -> dict:
         """Get information about a specific user."""
-        return self._users.get(user_id, {})
+        user = self._users.get(user_id)
+        return asdict(user) if user else {}
     
     def remove_user(self, user_id: int):
-        """Remove a user from the database."""
+        """Remove a user; the deletion is written with the next flush()."""
         if user_id in self._users:
             del self._users[user_id]
-            logger.info(f"User removed: {user_id}")
+            self._dirty.discard(user_id)
+            self._removed.add(user_id)
+            logger.info("User removed: %s", user_id)
+    
+    async def flush(self):
+        """Write batched user changes to SQLite on the database thread."""
+        if not self._dirty and not self._removed:
+            return
+        # Snapshot the rows here: the records keep changing while the write runs
+        rows = [
+            tuple(getattr(self._users[user_id], column) for column in self._COLUMNS)
+            for user_id in self._dirty
+        ]
+        removed = [(user_id,) for user_id in self._removed]
+        self._dirty.clear()
+        self._removed.clear()
+        if self._conn is not None:
+            await run_db(self._save, rows, removed)
+    
+    def _save(self, rows: List[tuple], removed: List[tuple]):
+        """Write users' rows and deletions through to SQLite in one transaction."""
+        try:
+            # Explicit BEGIN: the connection autocommits every statement otherwise
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("DELETE FROM users WHERE user_id = ?", removed)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO users "
+                    f"({', '.join(self._COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+        except sqlite3.Error as e:
+            logger.warning("User database write failed: %s", e)
+
+
+class TrackDatabase:
+    """Persists uploaded tracks' Telegram file_ids so restarts don't re-download them."""
+    
+    def __init__(self, ttl: float = FILE_ID_CACHE_TTL):
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+    
+    def open(self, conn: sqlite3.Connection):
+        """Create the track_cache table if needed and drop expired rows."""
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS track_cache ("
+                "url TEXT PRIMARY KEY, file_id TEXT NOT NULL, "
+                "title TEXT, artist TEXT, ts REAL NOT NULL)"
+            )
+            # Drop rows that can no longer be served
+            conn.execute("DELETE FROM track_cache WHERE ts < ?", (time.time() - self.ttl,))
+            self._conn = conn
+        except sqlite3.Error as e:
+            logger.warning("Track database unavailable, file_ids won't survive restarts: %s", e)
+    
+    async def get(self, url: str) -> Optional[Tuple[str, str, str]]:
+        """Get (file_id, title, artist) for a URL, or None if unknown or expired."""
+        if self._conn is None:
+            return None
+        return await run_db(self._get, url)
+    
+    def _get(self, url: str) -> Optional[Tuple[str, str, str]]:
+        try:
+            row = self._conn.execute(
+                "SELECT file_id, title, artist FROM track_cache WHERE url = ? AND ts >= ?",
+                (url, time.time() - self.ttl)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Track database read failed: %s", e)
+            return None
+        return tuple(row) if row else None
+    
+    async def store(self, url: str, file_id: str, title: str, artist: str):
+        """Remember the file_id a URL was uploaded as."""
+        if self._conn is not None:
+            await run_db(self._store, url, file_id, title, artist)
+    
+    def _store(self, url: str, file_id: str, title: str, artist: str):
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO track_cache (url, file_id, title, artist, ts) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, file_id, title, artist, time.time())
+            )
+        except sqlite3.Error as e:
+            logger.warning("Track database write failed: %s", e)
+
+
+class SearchDatabase:
+    """Persists users' result lists so result buttons keep working after a restart."""
+    
+    def __init__(self):
+        self._conn: Optional[sqlite3.Connection] = None
+    
+    def open(self, conn: sqlite3.Connection):
+        """Create the search_results table if needed and drop expired rows."""
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_results ("
+                "key TEXT PRIMARY KEY, results TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS search_results_expires ON search_results (expires_at)"
+            )
+            conn.execute("DELETE FROM search_results WHERE expires_at < ?", (time.time(),))
+            self._conn = conn
+        except sqlite3.Error as e:
+            logger.warning("Search database unavailable, results won't survive restarts: %s", e)
+    
+    async def get(self, key: str) -> Optional[List[Tuple[str, str, str]]]:
+        """Get a stored result list, or None if unknown or expired."""
+        if self._conn is None:
+            return None
+        return await run_db(self._get, key)
+    
+    def _get(self, key: str) -> Optional[List[Tuple[str, str, str]]]:
+        try:
+            row = self._conn.execute(
+                "SELECT results FROM search_results WHERE key = ? AND expires_at >= ?",
+                (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Search database read failed: %s", e)
+            return None
+        return [tuple(result) for result in json.loads(row[0])] if row else None
+    
+    async def store(self, key: str, results: list, ttl: float):
+        """Store a result list for ttl seconds."""
+        if self._conn is not None:
+            await run_db(self._execute,
+                "INSERT OR REPLACE INTO search_results (key, results, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(results, ensure_ascii=False), time.time() + ttl)
+            )
+    
+    async def delete(self, key: str):
+        """Delete a stored result list."""
+        if self._conn is not None:
+            await run_db(self._execute, "DELETE FROM search_results WHERE key = ?", (key,))
+    
+    async def purge_expired(self):
+        """Drop expired result lists (reads already skip them, this bounds the table)."""
+        if self._conn is not None:
+            await run_db(
+                self._execute, "DELETE FROM search_results WHERE expires_at < ?", (time.time(),)
+            )
+    
+    def _execute(self, sql: str, params: tuple):
+        try:
+            self._conn.execute(sql, params)
+        except sqlite3.Error as e:
+            logger.warning("Search database write failed: %s", e)
 
 
-# Global user database instance
+# Global user, track and search result database instances. They share one
+# connection, opened by open_databases(); until then nothing is persisted.
 user_db = UserDatabase()
+track_db = TrackDatabase()
+search_db = SearchDatabase()
+
+_connection: Optional[sqlite3.Connection] = None
+
+
+async def open_databases(path: str = CACHE_DB_PATH):
+    """Open the cache database once and attach every store to it."""
+    if _connection is None:
+        await run_db(_open_databases, path)
+
+
+async def close_databases():
+    """Write batched user activity and close the cache database."""
+    if _connection is not None:
+        await user_db.flush()
+        await run_db(_close_databases)
+
+
+def _open_databases(path: str):
+    global _connection
+    try:
+        _connection = _open_database(path)
+    except sqlite3.Error as e:
+        logger.warning("Cache database unavailable, nothing will survive restarts: %s", e)
+        return
+    for database in (user_db, track_db, search_db):
+        database.open(_connection)
+
+
+def _close_databases():
+    global _connection
+    for database in (user_db, track_db, search_db):
+        database._conn = None
+    _connection.close()
+    _connection = None
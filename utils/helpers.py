@@ -2,55 +2,179 @@
 Utility helper functions for the Musifyyy Bot.
 Contains cache management and formatting utilities.
 """
-from typing import Dict, Any
+import re
+import secrets
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, Hashable, List, Optional
+from telegram import InlineKeyboardButton
+
+from config.settings import (
+    QUERY_CACHE_SIZE, QUERY_CACHE_TTL, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_ID_BYTES,
+    INLINE_RESULT_CACHE_SIZE, INLINE_RESULT_CACHE_TTL,
+    FILE_ID_CACHE_SIZE, FILE_ID_CACHE_TTL, FILE_ID_MISS_TTL,
+)
+from utils.database import track_db, search_db
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after a fixed time."""
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+    
+    def store(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting the least recently used entry if full.
+        
+        ttl overrides the cache-wide expiry for this entry only.
+        """
+        self._cache[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get a fresh cached value, or None if missing or expired."""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return value
+    
+    def delete(self, key: Hashable):
+        """Delete a cached value if present."""
+        self._cache.pop(key, None)
 
 
 class SearchCache:
     """Manages temporary storage of search results."""
     
-    def __init__(self):
-        self._cache: Dict[int, list] = {}
+    def __init__(self, max_size: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL):
+        # Bounded and expiring, so abandoned searches don't pile up forever
+        self.ttl = ttl
+        self._cache = TTLCache(max_size, ttl)
     
-    def store(self, user_id: int, results: list):
-        """Store search results for a user."""
-        self._cache[user_id] = results
+    async def add(self, results: list) -> str:
+        """
+        Store a search's results (also persisted for restarts).
+        
+        Returns:
+            Short id of the search, carried in its buttons' callback_data
+        """
+        search_id = secrets.token_hex(SEARCH_ID_BYTES)
+        self._cache.store(search_id, results)
+        await search_db.store(search_id, results, self.ttl)
+        return search_id
     
-    def get(self, user_id: int) -> list:
-        """Get cached search results for a user."""
-        return self._cache.get(user_id, [])
+    async def get(self, search_id: str) -> list:
+        """Get cached results of a search."""
+        results = self._cache.get(search_id)
+        if results is None:
+            results = await search_db.get(search_id)
+            if results is not None:
+                self._cache.store(search_id, results)
+        return results or []
     
-    def clear(self, user_id: int):
-        """Clear cached results for a user."""
-        if user_id in self._cache:
-            del self._cache[user_id]
+    async def clear(self, search_id: str):
+        """Clear cached results of a search."""
+        self._cache.delete(search_id)
+        await search_db.delete(search_id)
     
-    def has(self, user_id: int) -> bool:
-        """Check if user has cached results."""
-        return user_id in self._cache
+    async def has(self, search_id: str) -> bool:
+        """Check if a search has cached (non-expired) results."""
+        return bool(await self.get(search_id))
+
+
+class FileIdCache:
+    """Maps source URLs to (file_id, title, artist), in memory and in the track database."""
+    
+    def __init__(
+        self,
+        max_size: int = FILE_ID_CACHE_SIZE,
+        ttl: float = FILE_ID_CACHE_TTL,
+        miss_ttl: float = FILE_ID_MISS_TTL
+    ):
+        self.miss_ttl = miss_ttl
+        # url -> entry, or False for URLs the database doesn't know either
+        self._cache = TTLCache(max_size, ttl)
+    
+    async def get(self, url: str) -> Optional[tuple]:
+        """Get a cached entry, falling back to the database (e.g. after a restart)."""
+        entry = self._cache.get(url)
+        if entry is None:
+            entry = await track_db.get(url)
+            if entry is not None:
+                self._cache.store(url, entry)
+            else:
+                # Most results were never uploaded; don't ask the database again
+                self._cache.store(url, False, ttl=self.miss_ttl)
+        return entry or None
+    
+    async def store(self, url: str, entry: tuple):
+        """Cache an entry and persist it."""
+        self._cache.store(url, entry)
+        await track_db.store(url, *entry)
 
 
 class InlineResultCache:
     """Manages temporary storage of inline query results."""
     
-    def __init__(self):
-        self._cache: Dict[str, Dict[str, Any]] = {}
+    def __init__(
+        self,
+        max_size: int = INLINE_RESULT_CACHE_SIZE,
+        ttl: float = INLINE_RESULT_CACHE_TTL
+    ):
+        # Most inline results are never picked, so entries must expire on their own
+        self._cache = TTLCache(max_size, ttl)
     
     def store(self, result_id: str, data: Dict[str, Any]):
         """Store inline result data."""
-        self._cache[result_id] = data
+        self._cache.store(result_id, data)
     
     def get(self, result_id: str) -> Dict[str, Any]:
         """Get cached inline result data."""
-        return self._cache.get(result_id, {})
+        return self._cache.get(result_id) or {}
     
     def has(self, result_id: str) -> bool:
-        """Check if result is cached."""
-        return result_id in self._cache
+        """Check if result is cached (and not expired)."""
+        return self._cache.get(result_id) is not None
     
     def delete(self, result_id: str):
         """Delete cached result."""
-        if result_id in self._cache:
-            del self._cache[result_id]
+        self._cache.delete(result_id)
+
+
+_QUERY_TOKEN_RE = re.compile(r"\w+")
+_QUERY_FILLER_WORDS = frozenset({"ft", "feat", "featuring"})
+
+
+def normalize_query(query: str) -> str:
+    """
+    Build a cache key that treats near-duplicate queries as equal.
+    
+    "Shallow feat Lady Gaga", "lady gaga - shallow" and "LADY GAGA  shallow"
+    all map to the same key: case, punctuation, word order and featuring
+    markers are ignored. Repeated words are kept, so "Duran Duran" and
+    "duran" stay different searches.
+    
+    Args:
+        query: Raw search query
+        
+    Returns:
+        Normalized query key
+    """
+    tokens = sorted(
+        token for token in _QUERY_TOKEN_RE.findall(query.casefold())
+        if token not in _QUERY_FILLER_WORDS
+    )
+    return " ".join(tokens) or query.strip().casefold()
 
 
 def format_platform_summary(results: list) -> str:
@@ -63,14 +187,48 @@ def format_platform_summary(results: list) -> str:
     Returns:
         Formatted platform summary string
     """
-    platform_counts = {}
-    for _, _, platform in results:
-        platform_counts[platform] = platform_counts.get(platform, 0) + 1
+    platform_counts = Counter(platform for _, _, platform in results)
     
-    return " • ".join([
+    return " • ".join(
         f"{count} from {platform}" 
         for platform, count in platform_counts.items()
-    ])
+    )
+
+
+@lru_cache(maxsize=256)
+def pagination_row(search_id: str, page: int, total_pages: int) -> List[InlineKeyboardButton]:
+    """
+    Build the Previous / page indicator / Next button row for a results page.
+    
+    Buttons are immutable, so a row is built once per search and page and
+    reused when the user flips back to it. Callers must not mutate the list.
+    
+    Args:
+        search_id: Id of the search the results belong to
+        page: Zero-based page index
+        total_pages: Total number of pages
+        
+    Returns:
+        List of navigation buttons
+    """
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton(
+            "⬅️ Previous", callback_data=f"page_{search_id}_{page-1}"
+        ))
+    
+    nav_buttons.append(InlineKeyboardButton(f"📄 {page+1}/{total_pages}", callback_data="page_info"))
+    
+    if page < total_pages - 1:
+        nav_buttons.append(InlineKeyboardButton(
+            "Next ➡️", callback_data=f"page_{search_id}_{page+1}"
+        ))
+    
+    return nav_buttons
+
+
+# Emoji prefixes added by MusicSearchEngine._format_title
+_TITLE_PREFIXES = ("🎵 ", "📺 ")
 
 
 def clean_title(title: str) -> str:
@@ -83,7 +241,28 @@ def clean_title(title: str) -> str:
     Returns:
         Cleaned title string
     """
-    return title.replace("🎵 ", "").replace("📺 ", "")
+    for prefix in _TITLE_PREFIXES:
+        if title.startswith(prefix):
+            return title[len(prefix):]
+    return title
+
+
+# Control characters plus the legacy Markdown markers, which can't be
+# escaped inside a *bold* entity and make Telegram reject the message
+_MARKDOWN_UNSAFE = str.maketrans("", "", "".join(map(chr, range(32))) + "*_`[")
+
+
+def markdown_safe(text: str) -> str:
+    """
+    Strip characters that would break a legacy Markdown message.
+    
+    Args:
+        text: Free text such as a track title or search query
+    
+    Returns:
+        Text safe to embed in a Markdown entity
+    """
+    return text.translate(_MARKDOWN_UNSAFE)
 
 
 def truncate_title(title: str, max_length: int = 65) -> str:
@@ -102,6 +281,29 @@ def truncate_title(title: str, max_length: int = 65) -> str:
     return title
 
 
+def short_error(error: Exception, max_length: int = 100) -> str:
+    """
+    Summarize an exception for a user-facing message.
+    
+    Only the first line of the message is kept, so long yt-dlp errors
+    (which may embed tracebacks or HTML) are not rendered in full.
+    
+    Args:
+        error: Exception to summarize
+        max_length: Maximum length of the message part
+        
+    Returns:
+        "ErrorType: first line of the message"
+    """
+    message = getattr(error, "msg", None) or str(error)
+    if not isinstance(message, str):
+        message = str(message)
+    first_line = message.partition("\n")[0]
+    return f"{type(error).__name__}: {first_line[:max_length]}"
+
+
 # Global cache instances
 search_cache = SearchCache()
 inline_result_cache = InlineResultCache()
+query_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+file_id_cache = FileIdCache()  # url -> (file_id, title, artist)